@@ -4,25 +4,46 @@ Script to check for new chapters from The Mavericks on ln.hako.vn
 and send Discord notifications when new chapters are found.
 """
 
-import json
+import asyncio
+import functools
 import logging
 import os
+import re
 import sys
-import time
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, Tuple
 
-import requests
-from bs4 import BeautifulSoup
+import httpx
+import orjson
+from selectolax.lexbor import LexborHTMLParser
+
+from group_page import fetch_group_page
 
 # Constants
-CACHE_FILE = "cache.json"
+CACHE_FILE = "cache.jsonl"
+LEGACY_CACHE_FILE = "cache.json"
+TEMPLATE_FILE = "discohook_message_2025-12-10.json"
+COMPACT_FACTOR = 4  # Compact once superseded rows outnumber live ones ~4:1
 GROUP_URL = "https://ln.hako.vn/nhom-dich/3474-the-mavericks"
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 }
 MAX_RETRIES = 3
 RETRY_DELAY = 5
+CONCURRENT_FETCHES = 8  # Be polite to ln.hako.vn
+WEBHOOK_CONCURRENCY = 5  # Discord allows ~30 webhook posts/minute
+
+# Precompiled patterns - these run once per chapter link, so compile them once.
+# Single alternation so each title is scanned once instead of once per variant.
+_CHAPTER_PATTERN = re.compile(
+    r'(?:Chương|Chapter|Chap)\s+(\d+(?:\.\d+)?)|#(\d+(?:\.\d+)?)',
+    re.IGNORECASE,
+)
+_URL_PATTERN = re.compile(r'/c(\d+(?:\.\d+)?)')
+_NOVEL_ID_PATTERN = re.compile(r'/truyen/(\d+)')
+
+# Sentinel returned when a conditional GET answers 304 Not Modified
+NOT_MODIFIED = object()
 
 # Setup logging
 logging.basicConfig(
@@ -34,53 +55,171 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=1)
+def _load_template_bytes() -> bytes:
+    """Read the webhook template file once per process."""
+    with open(TEMPLATE_FILE, 'rb') as f:
+        return f.read()
+
+@functools.lru_cache(maxsize=1)
+def _description_template() -> str:
+    """Rewrite the template description placeholders into str.format fields.
+
+    Done once so each notification fills them in a single format_map pass.
+    """
+    desc = orjson.loads(_load_template_bytes())['embeds'][0]['description']
+    desc = desc.replace('**Tên Truyện**', '{novel_title}')
+    desc = desc.replace('**Tên Chương**', '{chapter_name}')
+    desc = desc.replace('**Tên Danh Mục**', '{category}')
+    desc = desc.replace('timestamp', '{ts}')
+    desc = desc.replace('- Link chap tên miền docln.net', '- Link chap tên miền docln.net: {url_docln_net}')
+    desc = desc.replace('- Link chap tên miền docln.sbs', '- Link chap tên miền docln.sbs: {url_docln_sbs}')
+    desc = desc.replace('- Link chap tên miền ln.hako.vn', '- Link chap tên miền ln.hako.vn: {url_hako}')
+    return desc
+
 class ChapterChecker:
     def __init__(self, webhook_url: Optional[str]):
         self.webhook_url = webhook_url
         self.cache_file = CACHE_FILE
         self.group_url = GROUP_URL
-        self.session = requests.Session()
-        self.session.headers.update(HEADERS)
+        self._dirty_novels: set = set()
+        # HTTP/2 so repeat requests to the same host share one multiplexed
+        # TLS connection
+        self.session = httpx.Client(
+            http2=True, follow_redirects=True, headers=HEADERS, timeout=30,
+            limits=httpx.Limits(max_keepalive_connections=CONCURRENT_FETCHES))
 
     def load_cache(self) -> Dict:
-        """Load cached chapter data from file."""
+        """Load cached chapter data from the append-only JSONL cache.
+
+        Each line is either {"novel_id": ..., "data": {...}} or
+        {"last_check": ...}; later rows overwrite earlier ones. Falls back
+        to the legacy single-blob cache.json on first run after migration.
+        """
+        data = {"novels": {}, "last_check": None}
+        rows = 0
         if os.path.exists(self.cache_file):
             try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, IOError) as e:
+                with open(self.cache_file, 'rb') as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        row = orjson.loads(line)
+                        rows += 1
+                        if 'novel_id' in row:
+                            data['novels'][row['novel_id']] = row['data']
+                        elif 'last_check' in row:
+                            data['last_check'] = row['last_check']
+            except (orjson.JSONDecodeError, IOError) as e:
                 logger.warning(f"Failed to load cache: {e}")
-        return {"novels": {}, "last_check": None}
+        elif os.path.exists(LEGACY_CACHE_FILE):
+            try:
+                with open(LEGACY_CACHE_FILE, 'rb') as f:
+                    data = orjson.loads(f.read())
+                logger.info("Migrated legacy cache.json")
+            except (orjson.JSONDecodeError, IOError) as e:
+                logger.warning(f"Failed to load legacy cache: {e}")
+        # Migrate pre-dict caches: chapters used to be stored as a list
+        for novel_cache in data.get('novels', {}).values():
+            chapters = novel_cache.get('chapters')
+            if isinstance(chapters, list):
+                novel_cache['chapters'] = {str(chap['number']): chap for chap in chapters}
+        # Superseded rows pile up over time; rewrite once they dominate
+        if rows > COMPACT_FACTOR * (len(data['novels']) + 1):
+            self.compact_cache(data)
+        return data
+
+    def compact_cache(self, data: Dict):
+        """Rewrite the JSONL cache with one row per novel (atomic replace)."""
+        tmp_file = self.cache_file + '.tmp'
+        try:
+            with open(tmp_file, 'wb') as f:
+                for novel_id, novel_data in data['novels'].items():
+                    f.write(orjson.dumps({'novel_id': novel_id, 'data': novel_data}) + b'\n')
+                if data.get('last_check'):
+                    f.write(orjson.dumps({'last_check': data['last_check']}) + b'\n')
+            os.replace(tmp_file, self.cache_file)
+            logger.info("Cache compacted")
+        except IOError as e:
+            logger.error(f"Failed to compact cache: {e}")
 
     def save_cache(self, data: Dict):
-        """Save chapter data to cache file."""
+        """Append rows for changed novels plus the run's last_check."""
         try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            logger.info("Cache saved successfully")
+            with open(self.cache_file, 'ab') as f:
+                for novel_id in self._dirty_novels:
+                    f.write(orjson.dumps({'novel_id': novel_id,
+                                          'data': data['novels'][novel_id]}) + b'\n')
+                f.write(orjson.dumps({'last_check': data['last_check']}) + b'\n')
+            logger.info(f"Cache saved ({len(self._dirty_novels)} novels updated)")
         except IOError as e:
             logger.error(f"Failed to save cache: {e}")
 
-    def fetch_page(self, url: str) -> Optional[str]:
-        """Fetch the HTML content from the target URL with retry logic."""
+    async def fetch_page_async(self, session: httpx.AsyncClient, url: str,
+                               etag: Optional[str] = None,
+                               last_modified: Optional[str] = None) -> Tuple[object, Optional[str], Optional[str]]:
+        """Fetch a URL with retry logic and conditional-GET support (async).
+
+        Returns (html, etag, last_modified); html is NOT_MODIFIED when the
+        server answered 304 and None when all attempts failed.
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
         for attempt in range(MAX_RETRIES):
             try:
-                logger.info(f"Fetching page (attempt {attempt + 1}/{MAX_RETRIES})")
-                response = self.session.get(url, timeout=30)
+                logger.info(f"Fetching {url} (attempt {attempt + 1}/{MAX_RETRIES})")
+                response = await session.get(url, headers=headers)
+                if response.status_code == 304:
+                    logger.info(f"Not modified: {url}")
+                    return NOT_MODIFIED, etag, last_modified
                 response.raise_for_status()
-                return response.text
-            except requests.RequestException as e:
+                return (response.text,
+                        response.headers.get('ETag'),
+                        response.headers.get('Last-Modified'))
+            except httpx.HTTPError as e:
                 logger.warning(f"Request failed (attempt {attempt + 1}): {e}")
                 if attempt < MAX_RETRIES - 1:
-                    time.sleep(RETRY_DELAY * (2 ** attempt))  # Exponential backoff
+                    await asyncio.sleep(RETRY_DELAY * (2 ** attempt))  # Exponential backoff
                 else:
-                    logger.error("All retry attempts failed")
-                    return None
-        return None
+                    logger.error(f"All retry attempts failed for {url}")
+        return None, etag, last_modified
+
+    async def _fetch_and_parse(self, session: httpx.AsyncClient,
+                               semaphore: asyncio.Semaphore, novel: Dict,
+                               etag: Optional[str], last_modified: Optional[str]) -> Tuple[Dict, object, Optional[str], Optional[str]]:
+        """Fetch one novel page and parse its chapters off the event loop."""
+        async with semaphore:
+            html, etag, last_modified = await self.fetch_page_async(
+                session, novel['url'], etag=etag, last_modified=last_modified)
+        if html is NOT_MODIFIED or not html:
+            return novel, html, etag, last_modified
+        # Parse in a worker thread so CPU-bound parsing overlaps other fetches
+        chapters = await asyncio.to_thread(self.parse_chapters, html)
+        return novel, chapters, etag, last_modified
+
+    async def _check_novels(self, novels: List[Dict], cache: Dict) -> List[Tuple[Dict, object, Optional[str], Optional[str]]]:
+        """Fetch and parse all novel pages concurrently."""
+        limits = httpx.Limits(max_connections=CONCURRENT_FETCHES,
+                              max_keepalive_connections=CONCURRENT_FETCHES)
+        semaphore = asyncio.Semaphore(CONCURRENT_FETCHES)
+        async with httpx.AsyncClient(http2=True, follow_redirects=True,
+                                     headers=HEADERS, timeout=30,
+                                     limits=limits) as session:
+            tasks = []
+            for novel in novels:
+                novel_cache = cache['novels'].get(novel['id'], {})
+                tasks.append(self._fetch_and_parse(
+                    session, semaphore, novel,
+                    novel_cache.get('etag'), novel_cache.get('last_modified')))
+            return await asyncio.gather(*tasks)
 
     def get_novels(self) -> List[Dict]:
         """Fetch and parse novels from the group page."""
-        html = self.fetch_page(self.group_url)
+        html = fetch_group_page(self.group_url, client=self.session)
         if not html:
             logger.error("Failed to fetch group page")
             return []
@@ -88,21 +227,22 @@ class ChapterChecker:
 
     def parse_chapters(self, html: str) -> List[Dict]:
         """Parse chapter information from HTML."""
-        soup = BeautifulSoup(html, 'html.parser')
+        tree = LexborHTMLParser(html)
         chapters = []
 
         # Find chapter list container
-        chapter_list = soup.find('div', class_='list-chapter')
-        if not chapter_list:
+        chapter_list = tree.css_first('div.list-chapter')
+        if chapter_list is None:
             logger.warning("Chapter list container not found")
             return chapters
 
-        # Find all chapter links
-        chapter_links = chapter_list.find_all('a', href=True)
+        # Find all chapter links; they all share one scraped-at timestamp
+        now_iso = datetime.now(timezone.utc).isoformat()
+        chapter_links = chapter_list.css('a[href]')
         for link in chapter_links:
             try:
-                href = link.get('href', '')
-                title = link.get_text(strip=True)
+                href = link.attributes.get('href') or ''
+                title = link.text(strip=True)
 
                 # Extract chapter number from title or href
                 chapter_num = self.extract_chapter_number(title, href)
@@ -111,7 +251,7 @@ class ChapterChecker:
                         "number": chapter_num,
                         "title": title,
                         "url": f"https://ln.hako.vn{href}" if href.startswith('/') else href,
-                        "timestamp": datetime.now(timezone.utc).isoformat()
+                        "timestamp": now_iso
                     })
             except Exception as e:
                 logger.warning(f"Failed to parse chapter link: {e}")
@@ -124,28 +264,24 @@ class ChapterChecker:
 
     def parse_novels(self, html: str) -> List[Dict]:
         """Parse novel information from group page HTML."""
-        soup = BeautifulSoup(html, 'html.parser')
+        tree = LexborHTMLParser(html)
         novels = []
 
         # Find novel list container - based on actual HTML structure
-        novel_list = soup.find('section', class_='showcase-list')
-        if not novel_list:
+        novel_list = tree.css_first('section.showcase-list')
+        if novel_list is None:
             logger.warning("Novel list container not found")
             return novels
 
         # Find all novel title links
-        novel_titles = novel_list.find_all('h5', class_='series-name')
-        for title_elem in novel_titles:
+        novel_links = novel_list.css('h5.series-name a[href]')
+        for link in novel_links:
             try:
-                link = title_elem.find('a', href=True)
-                if not link:
-                    continue
-                href = link.get('href', '')
-                title = link.get_text(strip=True)
+                href = link.attributes.get('href') or ''
+                title = link.text(strip=True)
 
                 # Extract novel ID from URL
-                import re
-                match = re.search(r'/truyen/(\d+)', href)
+                match = _NOVEL_ID_PATTERN.search(href)
                 if match:
                     novel_id = match.group(1)
                     novels.append({
@@ -162,26 +298,16 @@ class ChapterChecker:
 
     def extract_chapter_number(self, title: str, href: str) -> Optional[float]:
         """Extract chapter number from title or URL."""
-        import re
-
         # Try to find chapter number in title
-        patterns = [
-            r'Chương\s+(\d+(?:\.\d+)?)',
-            r'Chapter\s+(\d+(?:\.\d+)?)',
-            r'Chap\s+(\d+(?:\.\d+)?)',
-            r'#(\d+(?:\.\d+)?)',
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, title, re.IGNORECASE)
-            if match:
-                try:
-                    return float(match.group(1))
-                except ValueError:
-                    continue
+        match = _CHAPTER_PATTERN.search(title)
+        if match:
+            try:
+                return float(match.group(1) or match.group(2))
+            except ValueError:
+                pass
 
         # Try to extract from URL
-        url_match = re.search(r'/c(\d+(?:\.\d+)?)', href)
+        url_match = _URL_PATTERN.search(href)
         if url_match:
             try:
                 return float(url_match.group(1))
@@ -191,24 +317,24 @@ class ChapterChecker:
         logger.warning(f"Could not extract chapter number from: {title}")
         return None
 
-    def get_new_chapters(self, current_chapters: List[Dict], cached_chapters: List[Dict]) -> List[Dict]:
+    def get_new_chapters(self, current_chapters: List[Dict], cached_chapters: Dict) -> List[Dict]:
         """Find chapters that are new compared to cache."""
         if not cached_chapters:
             # First run, consider all chapters as new but limit to avoid spam
             return current_chapters[:5]  # Only notify about latest 5 chapters
 
-        cached_nums = {chap['number'] for chap in cached_chapters}
-        new_chapters = [chap for chap in current_chapters if chap['number'] not in cached_nums]
+        # Cache is keyed by chapter number, so membership checks are O(1)
+        new_chapters = [chap for chap in current_chapters
+                        if str(chap['number']) not in cached_chapters]
 
         logger.info(f"Found {len(new_chapters)} new chapters")
         return new_chapters
 
-    def send_discord_notification(self, chapter: Dict):
-        """Send Discord notification for a new chapter."""
+    def _build_notification(self, chapter: Dict) -> Optional[Dict]:
+        """Build the webhook payload for a new chapter."""
         try:
-            # Load the template
-            with open('discohook_message_2025-12-10.json', 'r', encoding='utf-8') as f:
-                template = json.load(f)
+            # orjson.loads builds a fresh dict each call, so mutation is safe
+            template = orjson.loads(_load_template_bytes())
 
             # Update template with chapter data
             embed = template['embeds'][0]
@@ -220,14 +346,21 @@ class ChapterChecker:
             novel_title = chapter.get('novel_title', 'Unknown Novel')
             novel_url = chapter.get('novel_url', '')
 
-            # Update embed fields
-            embed['description'] = embed['description'].replace('**Tên Truyện**', novel_title)
-            embed['description'] = embed['description'].replace('**Tên Chương**', f'Chương {chapter_num}: {chapter_title}')
-            embed['description'] = embed['description'].replace('**Tên Danh Mục**', 'The Mavericks')
-            embed['description'] = embed['description'].replace('timestamp', str(int(datetime.fromisoformat(chapter['timestamp'].replace('Z', '+00:00')).timestamp())))
-            embed['description'] = embed['description'].replace('- Link chap tên miền docln.net', f'- Link chap tên miền docln.net: {chapter_url.replace("ln.hako.vn", "docln.net")}')
-            embed['description'] = embed['description'].replace('- Link chap tên miền docln.sbs', f'- Link chap tên miền docln.sbs: {chapter_url.replace("ln.hako.vn", "docln.sbs")}')
-            embed['description'] = embed['description'].replace('- Link chap tên miền ln.hako.vn', f'- Link chap tên miền ln.hako.vn: {chapter_url}')
+            # Mirror links differ from the canonical URL only by domain;
+            # compute each variant exactly once
+            url_docln_net = chapter_url.replace('ln.hako.vn', 'docln.net', 1)
+            url_docln_sbs = chapter_url.replace('ln.hako.vn', 'docln.sbs', 1)
+
+            # Fill every placeholder in one pass
+            embed['description'] = _description_template().format_map({
+                'novel_title': novel_title,
+                'chapter_name': f'Chương {chapter_num}: {chapter_title}',
+                'category': 'The Mavericks',
+                'ts': int(datetime.fromisoformat(chapter['timestamp'].replace('Z', '+00:00')).timestamp()),
+                'url_docln_net': url_docln_net,
+                'url_docln_sbs': url_docln_sbs,
+                'url_hako': chapter_url,
+            })
 
             # Update timestamp
             embed['timestamp'] = chapter['timestamp']
@@ -237,19 +370,48 @@ class ChapterChecker:
             embed['image']['url'] = 'https://i.hako.vn/ln/series/covers/s22527-2e663ae3-a81e-4a43-9be2-a9f090d6b3ec.jpg'  # Placeholder
             embed['thumbnail']['url'] = 'https://i.hako.vn/ln/series/covers/s22527-2e663ae3-a81e-4a43-9be2-a9f090d6b3ec.jpg'  # Placeholder
 
-            # Send webhook
-            response = requests.post(
-                self.webhook_url,
-                json=template,
-                headers={'Content-Type': 'application/json'},
-                timeout=10
-            )
-            response.raise_for_status()
-            logger.info(f"Discord notification sent for {novel_title} - Chapter {chapter_num}")
+            return template
 
         except Exception as e:
+            logger.error(f"Failed to build Discord notification: {e}")
+            return None
+
+    async def _send_notification(self, session: httpx.AsyncClient,
+                                 semaphore: asyncio.Semaphore, chapter: Dict):
+        """Post one webhook notification, honoring Discord's rate-limit headers."""
+        payload = self._build_notification(chapter)
+        if payload is None:
+            return
+        novel_title = chapter.get('novel_title', 'Unknown Novel')
+        try:
+            async with semaphore:
+                for attempt in range(MAX_RETRIES):
+                    response = await session.post(self.webhook_url, json=payload)
+                    if response.status_code == 429:
+                        retry_after = float(response.headers.get('Retry-After', '1'))
+                        logger.warning(f"Webhook rate limited, retrying in {retry_after}s")
+                        await asyncio.sleep(retry_after)
+                        continue
+                    response.raise_for_status()
+                    # Back off only when the rate-limit bucket is exhausted
+                    if response.headers.get('X-RateLimit-Remaining') == '0':
+                        reset_after = float(response.headers.get('X-RateLimit-Reset-After', '1'))
+                        await asyncio.sleep(reset_after)
+                    logger.info(f"Discord notification sent for {novel_title} - Chapter {chapter['number']}")
+                    return
+                logger.error(f"Webhook rate limit retries exhausted for {novel_title}")
+        except httpx.HTTPError as e:
             logger.error(f"Failed to send Discord notification: {e}")
 
+    async def _send_notifications(self, chapters: List[Dict]):
+        """Send all chapter notifications concurrently over one session."""
+        semaphore = asyncio.Semaphore(WEBHOOK_CONCURRENCY)
+        limits = httpx.Limits(max_keepalive_connections=WEBHOOK_CONCURRENCY)
+        async with httpx.AsyncClient(http2=True, follow_redirects=True,
+                                     timeout=30, limits=limits) as session:
+            await asyncio.gather(*[self._send_notification(session, semaphore, chapter)
+                                   for chapter in chapters])
+
     def run(self):
         """Main execution method."""
         logger.info("Starting chapter check")
@@ -265,27 +427,31 @@ class ChapterChecker:
 
         all_new_chapters = []
 
-        for novel in novels:
+        # Fetch and parse all novel pages concurrently
+        logger.info(f"Checking {len(novels)} novels")
+        results = asyncio.run(self._check_novels(novels, cache))
+
+        for novel, current_chapters, etag, last_modified in results:
             novel_id = novel['id']
             novel_url = novel['url']
             novel_title = novel['title']
 
-            logger.info(f"Checking novel: {novel_title}")
+            if current_chapters is NOT_MODIFIED:
+                # Page unchanged since last run - cached chapters still hold
+                logger.info(f"No changes for {novel_title} (304)")
+                continue
 
-            # Fetch novel page
-            html = self.fetch_page(novel_url)
-            if not html:
+            if current_chapters is None:
                 logger.warning(f"Failed to fetch page for {novel_title}")
                 continue
 
-            current_chapters = self.parse_chapters(html)
             if not current_chapters:
                 logger.warning(f"No chapters found for {novel_title}")
                 continue
 
             # Get cached chapters for this novel
             novel_cache = cache['novels'].get(novel_id, {})
-            cached_chapters = novel_cache.get('chapters', [])
+            cached_chapters = novel_cache.get('chapters', {})
 
             # Find new chapters
             new_chapters = self.get_new_chapters(current_chapters, cached_chapters)
@@ -300,18 +466,23 @@ class ChapterChecker:
             # Update cache for this novel
             if novel_id not in cache['novels']:
                 cache['novels'][novel_id] = {}
-            cache['novels'][novel_id]['chapters'] = current_chapters
+            cache['novels'][novel_id]['chapters'] = {str(chap['number']): chap
+                                                     for chap in current_chapters}
+            cache['novels'][novel_id]['etag'] = etag
+            cache['novels'][novel_id]['last_modified'] = last_modified
             cache['novels'][novel_id]['last_check'] = datetime.now(timezone.utc).isoformat()
+            self._dirty_novels.add(novel_id)
 
         # Send notifications for all new chapters (if webhook is configured)
         if self.webhook_url:
-            for chapter in all_new_chapters:
-                self.send_discord_notification(chapter)
-                time.sleep(1)  # Rate limiting
+            if all_new_chapters:
+                logger.info(f"Sending {len(all_new_chapters)} Discord notifications")
+                asyncio.run(self._send_notifications(all_new_chapters))
         else:
             logger.info(f"Skipping Discord notifications ({len(all_new_chapters)} new chapters found)")
 
-        # Update global last_check
+        # Update global last_check; appending is O(changed novels), so even
+        # a no-change run only writes one tiny row
         cache['last_check'] = datetime.now(timezone.utc).isoformat()
         self.save_cache(cache)
 
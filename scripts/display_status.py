@@ -1,33 +1,84 @@
+import hashlib
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter, Retry
+import lxml.etree
+import lxml.html
+import orjson
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 
-def scrape_page(url):
-    response = requests.get(url)
-    response.raise_for_status()
-    soup = BeautifulSoup(response.text, 'html.parser')
+from group_page import fetch_group_pages, HEADERS
+
+# One pooled session for the Discord webhook calls (page fetches go
+# through group_page's httpx client), so consecutive webhook requests
+# reuse their TCP/TLS connection instead of handshaking per request
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=20,
+                                      pool_block=False,
+                                      max_retries=Retry(total=3, backoff_factor=0.3)))
+
+# One parser instance shared across pages so its setup (tag interning
+# tables, recovery state) is paid once; pages arrive as already-decoded
+# text from the fetch cache, so no encoding declaration is needed
+_HTML_PARSER = lxml.html.HTMLParser(recover=True)
+
+# Precompiled selectors - etree.XPath parses the expression once at import
+# instead of on every call. The item selector matches the class token
+# exactly, like the old contains() but without substring false positives.
+_XP_ITEMS = lxml.etree.XPath(
+    '//div[contains(concat(" ", normalize-space(@class), " "), " showcase-item ")]')
+_XP_ITEM_NODES = lxml.etree.XPath(
+    './/h5[@class="series-name"]/a'
+    ' | .//span[@class="status-value"]'
+    ' | .//span[@class="status-value"]//time')
+
+@lru_cache(maxsize=1024)
+def _iso_to_unix(dt_str):
+    """Convert an ISO datetime string to a Unix timestamp.
+
+    Cached because many showcase items repeat the same update time.
+    """
+    return int(datetime.fromisoformat(dt_str.replace('Z', '+00:00')).timestamp())
+
+def parse_page(html):
+    # lxml.html + XPath walks each showcase item in a single C-level pass
+    root = lxml.html.fromstring(html, parser=_HTML_PARSER)
     novels = []
 
-    for item in soup.find_all('div', class_='showcase-item'):
-        title_elem = item.find('h5', class_='series-name').find('a')
-        title = title_elem.text.strip()
-        link = title_elem['href']
-        status_elem = item.find_all('span', class_='status-value')
-        status = status_elem[0].text.strip() if status_elem else 'Unknown'
+    for item in _XP_ITEMS(root):
+        # One union query fetches the title link, status spans and time
+        # element together in document order, instead of three tree walks
+        title_elem = None
+        status_elem = []
+        time_elem = None
+        for node in _XP_ITEM_NODES(item):
+            tag = node.tag
+            if tag == 'a':
+                if title_elem is None:
+                    title_elem = node
+            elif tag == 'span':
+                status_elem.append(node)
+            elif time_elem is None and len(status_elem) > 1:
+                # Only the time inside the second status span is meaningful
+                time_elem = node
+        if title_elem is None:
+            continue
+        title = title_elem.text_content().strip()
+        link = title_elem.get('href')
+        status = status_elem[0].text_content().strip() if status_elem else 'Unknown'
         last_update = 'Unknown'
         if len(status_elem) > 1:
-            time_elem = status_elem[1].find('time')
-            if time_elem and time_elem.get('datetime'):
+            if time_elem is not None and time_elem.get('datetime'):
                 # Parse ISO datetime and convert to Unix timestamp
-                dt_str = time_elem['datetime']
-                dt = datetime.fromisoformat(dt_str.replace('Z', '+00:00'))
-                timestamp = int(dt.timestamp())
+                timestamp = _iso_to_unix(time_elem.get('datetime'))
                 last_update = f"<t:{timestamp}:R>"  # Discord relative timestamp
-            elif time_elem and time_elem.get('title'):
-                last_update = time_elem['title']
+            elif time_elem is not None and time_elem.get('title'):
+                last_update = time_elem.get('title')
             else:
-                last_update = status_elem[1].text.strip()
+                last_update = status_elem[1].text_content().strip()
         novels.append({
             'title': title,
             'link': link,
@@ -37,90 +88,180 @@ def scrape_page(url):
 
     return novels
 
+# Below this many pages the fork/pickle overhead of a process pool
+# outweighs the parse work itself
+PARALLEL_PARSE_THRESHOLD = 4
+
 def get_all_novels(base_url, max_pages=2):
-    all_novels = []
-    for page in range(1, max_pages + 1):
-        url = f"{base_url}?page={page}"
-        print(f"Scraping {url}")
-        novels = scrape_page(url)
+    urls = [f"{base_url}?page={page}" for page in range(1, max_pages + 1)]
+    # Probe the first page before fanning out, so an empty group costs a
+    # single request instead of max_pages of them
+    print(f"Scraping {urls[0]}")
+    first_html = fetch_group_pages(urls[:1])[0]
+    if first_html is None:
+        # Proceeding with an empty list would overwrite novel_status.md
+        # with just the header (and poison the Discord state hash); fail
+        # the run instead so the workflow commits nothing
+        raise RuntimeError(f"Failed to fetch {urls[0]} after all retries")
+    all_novels = parse_page(first_html)
+    if not all_novels or max_pages == 1:
+        return all_novels
+
+    # Fetch the remaining pages concurrently, then parse in page order
+    print(f"Scraping {len(urls) - 1} more pages")
+    htmls = fetch_group_pages(urls[1:])
+    for url, html in zip(urls[1:], htmls):
+        if html is None:
+            # Dropping a failed page would shift later pages into its slot
+            # and publish a silently incomplete status list
+            raise RuntimeError(f"Failed to fetch {url} after all retries")
+    if len(htmls) >= PARALLEL_PARSE_THRESHOLD and (os.cpu_count() or 1) > 1:
+        # Parsing is CPU-bound; spread big batches across cores
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            parsed = list(executor.map(parse_page, htmls))
+    else:
+        parsed = [parse_page(html) for html in htmls]
+    for novels in parsed:
+        if not novels:
+            # Past the last populated page; later pages are empty too
+            break
         all_novels.extend(novels)
     return all_novels
 
+# Markdown line template, compiled once instead of re-built per novel
+_MD_TEMPLATE = ("[{title}](<https://docln.sbs{link}>)\n"
+                "> **Trạng thái:** {status}\n"
+                "> **Cập nhật:** {last_update}\n")
+
 def format_novel_markdown(novel):
-    full_link = f"https://docln.sbs{novel['link']}"
-    return f"[{novel['title']}](<{full_link}>)\n> **Trạng thái:** {novel['status']}\n> **Cập nhật:** {novel['last_update']}\n"
+    return _MD_TEMPLATE.format_map(novel)
+
+STATE_FILE = 'state.json'
+
+def load_state():
+    """Load persisted Discord state (message id, last content hash).
+
+    Falls back to the legacy single-value files from before the state was
+    consolidated.
+    """
+    if os.path.exists(STATE_FILE):
+        try:
+            with open(STATE_FILE, 'rb') as f:
+                return orjson.loads(f.read())
+        except (orjson.JSONDecodeError, IOError) as e:
+            print(f"Failed to load {STATE_FILE}: {e}")
+    state = {}
+    if os.path.exists('message_id.txt'):
+        with open('message_id.txt', 'r') as f:
+            state['message_id'] = f.read().strip()
+    if os.path.exists('message_hash.txt'):
+        with open('message_hash.txt', 'r') as f:
+            state['message_hash'] = f.read().strip()
+    return state
+
+def save_state(state):
+    """Write the state atomically so an interrupted run can't corrupt it."""
+    tmp_file = STATE_FILE + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(orjson.dumps(state, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_file, STATE_FILE)
+
+# Constant fragments of the embed fields, hoisted out of the build loops
+_STATUS_PREFIX = "**Trạng thái:** "
+_UPDATE_PREFIX = "\n**Cập nhật:** "
+_EMBED_TITLE = "Trạng thái các bộ truyện - The Mavericks"
+
+def _build_field(novel):
+    # Truncate title if too long (Discord limit 256 chars for field name)
+    title = novel['title'][:250] + "..." if len(novel['title']) > 250 else novel['title']
+    value = ''.join((_STATUS_PREFIX, novel['status'], _UPDATE_PREFIX, novel['last_update']))
+    # Ensure value is under 1024 chars
+    if len(value) > 1000:
+        value = value[:997] + "..."
+    return {
+        "name": title,
+        "value": value,
+        "inline": False
+    }
 
 def send_status_to_discord(novels, webhook_url, message_id=None):
     # Split novels into chunks of 25 (Discord embed field limit)
     chunk_size = 25
     chunks = [novels[i:i + chunk_size] for i in range(0, len(novels), chunk_size)]
+    total = len(novels)
+    n_chunks = len(chunks)
 
     embeds = []
     for i, chunk in enumerate(chunks):
-        fields = []
-        for novel in chunk:
-            # Truncate title if too long (Discord limit 256 chars for field name)
-            title = novel['title'][:250] + "..." if len(novel['title']) > 250 else novel['title']
-            # Field value with status and update
-            value = f"**Trạng thái:** {novel['status']}\n**Cập nhật:** {novel['last_update']}"
-            # Ensure value is under 1024 chars
-            if len(value) > 1000:
-                value = value[:997] + "..."
-            fields.append({
-                "name": title,
-                "value": value,
-                "inline": False
-            })
-
-        title_text = "Trạng thái các bộ truyện - The Mavericks"
-        if len(chunks) > 1:
-            title_text += f" (phần {i+1})"
-
+        title_text = _EMBED_TITLE if n_chunks == 1 else f"{_EMBED_TITLE} (phần {i+1})"
         embed = {
             "title": title_text,
             "color": 0x0099ff,  # Blue color
-            "fields": fields,
+            "fields": [_build_field(novel) for novel in chunk],
             "footer": {
-                "text": f"Tổng cộng {len(novels)} bộ truyện • Phần {i+1}/{len(chunks)}"
+                "text": f"Tổng cộng {total} bộ truyện • Phần {i+1}/{n_chunks}"
             }
         }
         embeds.append(embed)
 
-    payload = {"embeds": embeds}
-    if message_id:
-        # Edit existing message
-        url = f"{webhook_url}/messages/{message_id}"
-        response = requests.patch(url, json=payload)
-    else:
-        # Send new message
-        response = requests.post(webhook_url, json=payload)
-    response.raise_for_status()
-    return response.json().get('id') if not message_id else message_id
+    # Discord accepts at most 10 embeds per message, so batch accordingly;
+    # the shared SESSION keeps one TLS connection across the batches
+    first_response = None
+    for start in range(0, len(embeds), 10):
+        group_payload = {"embeds": embeds[start:start + 10]}
+        if start == 0 and message_id:
+            # Edit existing message; overflow batches go out as new messages
+            url = f"{webhook_url}/messages/{message_id}"
+            response = SESSION.patch(url, json=group_payload, timeout=10)
+        else:
+            response = SESSION.post(webhook_url, json=group_payload, timeout=10)
+        response.raise_for_status()
+        if start == 0:
+            first_response = response
+    return first_response.json().get('id') if not message_id else message_id
 
 if __name__ == "__main__":
-    base_url = "https://docln.sbs/nhom-dich/3474-the-mavericks"
-    novels = get_all_novels(base_url)
+    try:
+        base_url = "https://docln.sbs/nhom-dich/3474-the-mavericks"
+        novels = get_all_novels(base_url)
 
-    with open('novel_status.md', 'w', encoding='utf-8') as f:
-        f.write("# Trạng thái các bộ truyện - The Mavericks\n\n")
-        for novel in novels:
-            f.write(format_novel_markdown(novel) + "\n")
+        # Build the whole document in memory and write it in one go
+        parts = ["# Trạng thái các bộ truyện - The Mavericks\n\n"]
+        parts.extend(format_novel_markdown(novel) + "\n" for novel in novels)
+        document = "".join(parts)
 
-    print("Status saved to novel_status.md")
+        status_file = 'novel_status.md'
+        previous = None
+        if os.path.exists(status_file):
+            with open(status_file, 'r', encoding='utf-8') as f:
+                previous = f.read()
+        if document != previous:
+            with open(status_file, 'w', encoding='utf-8') as f:
+                f.write(document)
+            print("Status saved to novel_status.md")
+        else:
+            print("novel_status.md unchanged, skipping write")
 
-    webhook_url = os.environ.get('STATUS_WEBHOOK_URL')
-    if webhook_url:
-        try:
-            message_id = None
-            message_id_file = 'message_id.txt'
-            if os.path.exists(message_id_file):
-                with open(message_id_file, 'r') as f:
-                    message_id = f.read().strip()
-            message_id = send_status_to_discord(novels, webhook_url, message_id)
-            with open(message_id_file, 'w') as f:
-                f.write(message_id)
-            print("Status sent to Discord")
-        except Exception as e:
-            print(f"Failed to send to Discord: {e}")
-    else:
-        print("No Discord webhook URL provided")
\ No newline at end of file
+        webhook_url = os.environ.get('STATUS_WEBHOOK_URL')
+        if webhook_url:
+            try:
+                # Skip the Discord round-trip when the scraped content is
+                # byte-for-byte what we last posted
+                state = load_state()
+                content_hash = hashlib.sha256(
+                    orjson.dumps(novels, option=orjson.OPT_SORT_KEYS)).hexdigest()
+                if content_hash == state.get('message_hash'):
+                    print("Status unchanged, skipping Discord update")
+                else:
+                    message_id = send_status_to_discord(
+                        novels, webhook_url, state.get('message_id'))
+                    state['message_id'] = message_id
+                    state['message_hash'] = content_hash
+                    save_state(state)
+                    print("Status sent to Discord")
+            except Exception as e:
+                print(f"Failed to send to Discord: {e}")
+        else:
+            print("No Discord webhook URL provided")
+    finally:
+        SESSION.close()
\ No newline at end of file
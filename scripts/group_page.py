@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Shared fetch layer for The Mavericks group pages.
+
+Both check_updates.py and display_status.py scrape the team's group
+listing. Fetches go through a small on-disk cache keyed by URL that
+stores each page's HTML together with its ETag/Last-Modified
+validators, so a page that has not changed since the last run is
+answered with 304 and served from cache instead of being downloaded
+and parsed again. The two scripts currently hit different mirror
+domains, so cross-script reuse only kicks in when the URLs match, but
+each script still skips unchanged downloads on every run.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import orjson
+import requests
+
+GROUP_CACHE_FILE = "group_page_cache.json"
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    # Prefer Brotli - noticeably better compression ratio than gzip for HTML
+    "Accept-Encoding": "br, gzip, deflate",
+}
+MAX_RETRIES = 3
+RETRY_DELAY = 5
+CONCURRENT_FETCHES = 10
+
+logger = logging.getLogger(__name__)
+
+# Lazily-loaded URL -> {html, etag, last_modified} cache
+_cache: Optional[Dict] = None
+
+
+def _load_cache() -> Dict:
+    global _cache
+    if _cache is None:
+        _cache = {}
+        if os.path.exists(GROUP_CACHE_FILE):
+            try:
+                with open(GROUP_CACHE_FILE, 'rb') as f:
+                    _cache = orjson.loads(f.read())
+            except (orjson.JSONDecodeError, IOError) as e:
+                logger.warning(f"Failed to load group page cache: {e}")
+    return _cache
+
+
+def _save_cache():
+    tmp_file = GROUP_CACHE_FILE + '.tmp'
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(orjson.dumps(_cache))
+        os.replace(tmp_file, GROUP_CACHE_FILE)
+    except IOError as e:
+        logger.error(f"Failed to save group page cache: {e}")
+
+
+def fetch_group_page(url: str, client=None) -> Optional[str]:
+    """Fetch a group page with retry logic and conditional-GET caching.
+
+    ``client`` is anything with a requests-style ``get`` (a
+    requests.Session, an httpx.Client, or the requests module itself).
+    Returns the page HTML, or None when all attempts failed.
+    """
+    cache = _load_cache()
+    entry = cache.get(url, {})
+    headers = dict(HEADERS)
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    getter = client if client is not None else requests
+
+    for attempt in range(MAX_RETRIES):
+        try:
+            logger.info(f"Fetching {url} (attempt {attempt + 1}/{MAX_RETRIES})")
+            response = getter.get(url, headers=headers, timeout=30)
+            if response.status_code == 304 and entry.get('html'):
+                logger.info(f"Group page unchanged: {url}")
+                return entry['html']
+            response.raise_for_status()
+            # Without a charset header requests falls back to chardet, which
+            # does a full-body scan; the site serves UTF-8, so skip that
+            if response.encoding is None:
+                response.encoding = 'utf-8'
+            cache[url] = {
+                'html': response.text,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+            _save_cache()
+            return response.text
+        except Exception as e:
+            logger.warning(f"Request failed (attempt {attempt + 1}): {e}")
+            if attempt < MAX_RETRIES - 1:
+                time.sleep(RETRY_DELAY * (2 ** attempt))  # Exponential backoff
+            else:
+                logger.error(f"All retry attempts failed for {url}")
+    return None
+
+
+async def _fetch_group_page_async(client: httpx.AsyncClient, url: str) -> Optional[str]:
+    """Async twin of fetch_group_page; the cache write is deferred to the caller."""
+    cache = _load_cache()
+    entry = cache.get(url, {})
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+
+    for attempt in range(MAX_RETRIES):
+        try:
+            logger.info(f"Fetching {url} (attempt {attempt + 1}/{MAX_RETRIES})")
+            response = await client.get(url, headers=headers)
+            if response.status_code == 304 and entry.get('html'):
+                logger.info(f"Group page unchanged: {url}")
+                return entry['html']
+            response.raise_for_status()
+            cache[url] = {
+                'html': response.text,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+            return response.text
+        except httpx.HTTPError as e:
+            logger.warning(f"Request failed (attempt {attempt + 1}): {e}")
+            if attempt < MAX_RETRIES - 1:
+                await asyncio.sleep(RETRY_DELAY * (2 ** attempt))  # Exponential backoff
+            else:
+                logger.error(f"All retry attempts failed for {url}")
+    return None
+
+
+def fetch_group_pages(urls: List[str]) -> List[Optional[str]]:
+    """Fetch several group pages concurrently over one pooled client.
+
+    Returns the HTML per URL in input order (None where all attempts
+    failed), with the same conditional-GET caching as fetch_group_page.
+    """
+    async def _run():
+        limits = httpx.Limits(max_connections=CONCURRENT_FETCHES,
+                              max_keepalive_connections=CONCURRENT_FETCHES)
+        async with httpx.AsyncClient(http2=True, follow_redirects=True,
+                                     headers=HEADERS, timeout=30,
+                                     limits=limits) as client:
+            return await asyncio.gather(*[_fetch_group_page_async(client, url)
+                                          for url in urls])
+
+    results = asyncio.run(_run())
+    _save_cache()
+    return list(results)